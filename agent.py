@@ -8,6 +8,9 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import HumanMessage, AIMessage
+from plan_cache import CachedPlanAgent, plan_cache, STATE_SLOTS
+from user_context import current_user_id
+import records
 
 # Define the tools available to the model
 tools = [
@@ -78,6 +81,9 @@ To place an order ("Add to cart"), you **MUST** have the following information.
 class Agent:
     def __init__(self):
         self.chat_history = []
+        # Structured conversation state (ids seen in tool calls, last tool used).
+        # Used to key and fill cached tool-call plans.
+        self.state = {}
         self._setup_agent()
 
     def _setup_agent(self):
@@ -92,9 +98,10 @@ class Agent:
             ("placeholder", "{agent_scratchpad}"),
         ])
 
-    async def process_message(self, user_message: str):
+    async def process_message(self, user_message: str, callbacks=None):
         """
         Process a user message using LangChain AgentExecutor.
+        `callbacks` are passed through to the executor (used for turn profiling).
         """
         try:
             # Determine which LLM to use
@@ -125,16 +132,23 @@ class Agent:
                 )
 
             # Create Agent
-            agent = create_tool_calling_agent(llm, tools, self.prompt)
-            agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+            # The first step of a turn may be answered from the plan cache instead of the LLM
+            agent = CachedPlanAgent(
+                runnable=create_tool_calling_agent(llm, tools, self.prompt),
+                plan_cache=plan_cache,
+                cache_context=llm_provider,
+                state=self.state
+            )
+            agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True, return_intermediate_steps=True)
 
             # Execute
             response_dict = await agent_executor.ainvoke({
                 "input": user_message, 
                 "chat_history": self.chat_history
-            })
+            }, config={"callbacks": callbacks} if callbacks else None)
             
             response_text = response_dict["output"]
+            self._update_state(response_dict.get("intermediate_steps", []))
             
             # Update memory
             self.chat_history.append(HumanMessage(content=user_message))
@@ -149,3 +163,21 @@ class Agent:
         except Exception as e:
             traceback.print_exc()
             return f"Error processing message: {str(e)}"
+
+    def _update_state(self, intermediate_steps):
+        """Remember ids used in this turn's tool calls and the last tool called."""
+        last_tool = None
+        for action, _ in intermediate_steps:
+            last_tool = action.tool
+            if isinstance(action.tool_input, dict):
+                for slot in STATE_SLOTS:
+                    value = action.tool_input.get(slot)
+                    if value is None:
+                        continue
+                    # Intentional: a replayed plan fills $state:address_id from here, so
+                    # never remember an address_id that isn't one of the user's saved
+                    # addresses (records.py tracks them; None means not fetched yet)
+                    if slot == "address_id" and records.is_known_address(current_user_id.get(None), value) is False:
+                        continue
+                    self.state[slot] = value
+        self.state["last_tool"] = last_tool
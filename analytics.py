@@ -0,0 +1,260 @@
+"""
+Streaming analytics and export over the `orders` and `carts` tables.
+
+Rows are read with a single cursor and pulled in `fetchmany` batches, so
+memory stays bounded no matter how large the tables get. Aggregations are
+updated row by row and only keep one counter per restaurant / status / hour.
+
+Usage:
+    python analytics.py summary [--table orders] [--since 2024-01-01] [--until ...] [--top 10]
+    python analytics.py export orders --format csv --output orders.csv
+    python analytics.py export carts --format jsonl --output -
+"""
+import argparse
+import csv
+import json
+import pathlib
+import sqlite3
+import sys
+from collections import Counter
+from database import DB_NAME
+
+TABLE_COLUMNS = {
+    "orders": ("id", "user_id", "cart_id", "restaurant_id", "items", "status", "created_at"),
+    "carts": ("id", "cart_id", "user_id", "restaurant_id", "items", "created_at"),
+}
+
+DEFAULT_BATCH_SIZE = 5000
+
+# "YYYY-MM-DD HH" bucket, computed inside SQLite so Python never parses timestamps
+HOUR_BUCKET = "substr(created_at, 1, 13)"
+
+# Order funnel, in the order a cart moves through it
+FUNNEL_STAGES = ("cart_created", "pending_payment", "delivered")
+
+# Statuses a cart can only reach after pending_payment (compared lowercased,
+# with spaces and dashes as underscores). Anything else -- NULL, "unknown",
+# cancelled, failed -- isn't counted past cart_created and is reported separately.
+PAID_STATUSES = {
+    "placed", "order_placed", "confirmed", "order_confirmed", "accepted", "preparing",
+    "ready", "picked_up", "dispatched", "out_for_delivery", "on_the_way",
+}
+DELIVERED_STATUSES = {"delivered", "order_delivered"}
+
+
+def connect_readonly(db_name=DB_NAME):
+    """Open the database read-only so analytics can never modify order data."""
+    # as_uri() percent-encodes the path, so names containing '?' or '#' still work
+    conn = sqlite3.connect(pathlib.Path(db_name).resolve().as_uri() + "?mode=ro", uri=True)
+    # A streaming scan never revisits pages, so a small page cache is enough
+    conn.execute("PRAGMA cache_size = -8000")
+    return conn
+
+
+def iter_rows(conn, table, columns=None, since=None, until=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Yield rows (tuples) from `table`, optionally restricted to a created_at range.
+    Rows are streamed from the cursor in batches of `batch_size`.
+    """
+    if table not in TABLE_COLUMNS:
+        raise ValueError(f"Unknown table: {table}")
+    columns = columns or TABLE_COLUMNS[table]
+    for column in columns:
+        # Column names can't be bound as parameters, so validate them instead
+        if column not in TABLE_COLUMNS[table] and column != HOUR_BUCKET:
+            raise ValueError(f"Unknown column for {table}: {column}")
+
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    conditions = []
+    params = []
+    if since:
+        conditions.append("created_at >= ?")
+        params.append(since)
+    if until:
+        conditions.append("created_at < ?")
+        params.append(until)
+    if conditions:
+        # Served by the created_at index; no ORDER BY so SQLite never has to sort
+        query += " WHERE " + " AND ".join(conditions)
+
+    cursor = conn.cursor()
+    cursor.arraysize = batch_size
+    cursor.execute(query, params)
+    try:
+        while True:
+            batch = cursor.fetchmany()
+            if not batch:
+                break
+            yield from batch
+    finally:
+        cursor.close()
+
+
+def summarize(conn, table="orders", since=None, until=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Compute orders per restaurant, status funnel and hourly volume in one pass.
+    Only the columns the aggregations need are read (never the `items` JSON).
+    """
+    has_status = table == "orders"
+    columns = ["restaurant_id", HOUR_BUCKET]
+    if has_status:
+        columns.append("status")
+
+    per_restaurant = Counter()
+    per_hour = Counter()
+    statuses = Counter()
+    total = 0
+
+    for row in iter_rows(conn, table, columns, since, until, batch_size):
+        total += 1
+        per_restaurant[row[0]] += 1
+        per_hour[row[1]] += 1
+        if has_status:
+            statuses[row[2]] += 1
+
+    summary = {
+        "table": table,
+        "total": total,
+        "per_restaurant": per_restaurant,
+        "hourly_volume": dict(sorted((hour, count) for hour, count in per_hour.items() if hour)),
+    }
+    if has_status:
+        summary["statuses"] = statuses
+        summary["funnel"] = build_funnel(statuses, total)
+    return summary
+
+
+def _normalize_status(status):
+    return status.strip().lower().replace(" ", "_").replace("-", "_") if isinstance(status, str) else None
+
+
+def build_funnel(statuses, total):
+    """
+    Turn status counts into funnel stage counts.
+
+    The orders table only keeps the latest status of each cart, so a cart
+    counts toward every stage up to the one it has reached: `pending_payment`
+    counts carts in that status or any known later one, and `delivered` only
+    the delivered ones. Statuses outside the funnel (NULL, unknown, cancelled,
+    failed, ...) are returned under `other` instead of being guessed at.
+    """
+    pending = delivered = 0
+    other = Counter()
+    for status, count in statuses.items():
+        normalized = _normalize_status(status)
+        if normalized in DELIVERED_STATUSES:
+            delivered += count
+            pending += count
+        elif normalized == "pending_payment" or normalized in PAID_STATUSES:
+            pending += count
+        elif normalized != "cart_created":
+            other[status] += count
+    return {
+        "cart_created": total,
+        "pending_payment": pending,
+        "delivered": delivered,
+        "other": other,
+    }
+
+
+def export(conn, table, fmt, output, since=None, until=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream `table` to a file object as CSV or JSONL, one batch at a time. Returns the row count."""
+    columns = TABLE_COLUMNS[table]
+    rows = iter_rows(conn, table, columns, since, until, batch_size)
+    count = 0
+
+    if fmt == "csv":
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                writer.writerows(batch)
+                count += len(batch)
+                batch = []
+        writer.writerows(batch)
+        count += len(batch)
+    elif fmt == "jsonl":
+        lines = []
+        for row in rows:
+            # `items` is already JSON; keep it as a string rather than re-decoding every row
+            lines.append(json.dumps(dict(zip(columns, row))))
+            if len(lines) >= batch_size:
+                output.write("\n".join(lines) + "\n")
+                count += len(lines)
+                lines = []
+        if lines:
+            output.write("\n".join(lines) + "\n")
+            count += len(lines)
+    else:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    return count
+
+
+def print_summary(summary, top=10):
+    print(f"Table: {summary['table']} ({summary['total']} rows)")
+
+    print(f"\nTop {top} restaurants:")
+    for res_id, count in summary["per_restaurant"].most_common(top):
+        print(f"- {res_id}: {count}")
+
+    if "funnel" in summary:
+        print("\nFunnel:")
+        funnel = summary["funnel"]
+        for stage in FUNNEL_STAGES:
+            count = funnel[stage]
+            share = (count / funnel["cart_created"] * 100) if funnel["cart_created"] else 0
+            print(f"- {stage}: {count} ({share:.1f}%)")
+        if funnel["other"]:
+            print("Outside the funnel:")
+            for status, count in funnel["other"].most_common():
+                print(f"- {status}: {count}")
+        print("\nStatuses:")
+        for status, count in summary["statuses"].most_common():
+            print(f"- {status}: {count}")
+
+    print("\nHourly volume:")
+    for hour, count in summary["hourly_volume"].items():
+        print(f"- {hour}:00 {count}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Order history analytics and export.")
+    parser.add_argument("--db", default=DB_NAME, help="Path to the SQLite database")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    summary_parser = subparsers.add_parser("summary", help="Per-restaurant counts, funnel and hourly volume")
+    summary_parser.add_argument("--table", choices=TABLE_COLUMNS, default="orders")
+    summary_parser.add_argument("--since", help="Only rows with created_at >= SINCE (e.g. 2024-01-01)")
+    summary_parser.add_argument("--until", help="Only rows with created_at < UNTIL")
+    summary_parser.add_argument("--top", type=int, default=10)
+
+    export_parser = subparsers.add_parser("export", help="Export a table to CSV or JSONL")
+    export_parser.add_argument("table", choices=TABLE_COLUMNS)
+    export_parser.add_argument("--format", choices=("csv", "jsonl"), default="csv")
+    export_parser.add_argument("--output", default="-", help="Output file ('-' for stdout)")
+    export_parser.add_argument("--since")
+    export_parser.add_argument("--until")
+
+    args = parser.parse_args(argv)
+    conn = connect_readonly(args.db)
+    try:
+        if args.command == "summary":
+            summary = summarize(conn, args.table, args.since, args.until, args.batch_size)
+            print_summary(summary, args.top)
+        else:
+            if args.output == "-":
+                count = export(conn, args.table, args.format, sys.stdout, args.since, args.until, args.batch_size)
+            else:
+                with open(args.output, "w", newline="", encoding="utf-8") as f:
+                    count = export(conn, args.table, args.format, f, args.since, args.until, args.batch_size)
+            print(f"Exported {count} rows from {args.table}", file=sys.stderr)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
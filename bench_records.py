@@ -0,0 +1,111 @@
+"""
+Memory benchmark: decoded JSON trees vs compact records (records.py).
+
+Builds synthetic payloads shaped like the Zomato MCP responses (with the
+extra fields the real API returns and we never read), then measures how
+much memory stays allocated when we keep the decoded tree versus the
+parsed records.
+
+Usage:
+    python bench_records.py [--restaurants 20] [--menu-items 150]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+import records
+
+
+def make_restaurant(i):
+    return {
+        "info": {
+            "res_id": 100000 + i,
+            "name": f"Restaurant {i}",
+            "rating": {"aggregate_rating": "4.1", "rating_text": "Very Good", "votes": 1234, "rating_color": "5BA829"},
+            "cuisine": [{"name": c, "deeplink": f"zomato://search?cuisine={c}"} for c in ("North Indian", "Chinese", "Biryani")],
+            "image": {"url": f"https://b.zmtcdn.com/data/pictures/{i}/image.jpg?fit=around|750:500&crop=750:500"},
+            "locality": {"name": "Indiranagar", "address": f"{i}, 100 Feet Road, Indiranagar, Bangalore", "lat": 12.97, "lng": 77.64},
+            "order": {"delivery_time": "30 min", "min_order": 150, "packaging_charges": 20, "is_serviceable": True},
+            "offers": [{"text": "50% OFF up to ₹100", "code": "TRYNEW", "terms": "Valid on orders above ₹159"}],
+            "tags": ["pure_veg", "pocket_friendly", "hygiene_rated"],
+        },
+        "tracking": {"search_id": f"abc{i}", "position": i, "experiment_buckets": ["a", "b", "c"]},
+    }
+
+
+def make_search_payload(n):
+    return json.dumps({
+        "restaurants": [make_restaurant(i) for i in range(n // 2)],
+        "sections": {"SECTION_SEARCH_RESULT": [make_restaurant(i) for i in range(n // 2, n)]},
+        "postback_params": {"page": 2, "search_id": "xyz"},
+    })
+
+
+def make_menu_item(i):
+    return {
+        "id": f"ctl_{i}",
+        "name": f"Dish {i}",
+        "price": 199 + i,
+        "desc": "A long marketing description of the dish, its ingredients and how it is served. " * 2,
+        "image": f"https://b.zmtcdn.com/data/dish_photos/{i}.jpg",
+        "tags": ["bestseller", "spicy"],
+        "dietary_slugs": ["veg"],
+        "rating": {"value": 4.3, "votes": 87},
+        "variants": [
+            {"variant_id": f"v_{i}_{size}", "name": size, "price": 199 + i + k * 100, "is_default": k == 0}
+            for k, size in enumerate(("Regular", "Medium", "Large"))
+        ],
+    }
+
+
+def make_menu_payload(n):
+    categories = []
+    for c in range(max(1, n // 15)):
+        categories.append({
+            "name": f"Category {c}",
+            "description": "Category description",
+            "items": [make_menu_item(c * 15 + j) for j in range(15)],
+        })
+    return json.dumps({"menu": {"categories": categories}, "res_id": 100001})
+
+
+def retained(build):
+    """Bytes still allocated after `build()` returns, for the object it returns."""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del obj
+    return size
+
+
+def report(label, count, before, after):
+    print(f"{label}:")
+    print(f"  decoded JSON : {before:>10,} bytes total, {before / count:>8,.0f} per entry")
+    print(f"  records      : {after:>10,} bytes total, {after / count:>8,.0f} per entry")
+    print(f"  reduction    : {before / after:.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--restaurants", type=int, default=20)
+    parser.add_argument("--menu-items", type=int, default=150)
+    args = parser.parse_args()
+
+    search_payload = make_search_payload(args.restaurants)
+    before = retained(lambda: json.loads(search_payload))
+    after = retained(lambda: records.parse_restaurant_search(search_payload))
+    report(f"Search results ({args.restaurants} restaurants)", args.restaurants, before, after)
+
+    menu_payload = make_menu_payload(args.menu_items)
+    menu_count = len(records.parse_menu(menu_payload))
+    before = retained(lambda: json.loads(menu_payload))
+    after = retained(lambda: records.parse_menu(menu_payload))
+    report(f"Menu ({menu_count} items, per item)", menu_count, before, after)
+    print(f"  per menu     : {before:,} -> {after:,} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,3 +7,33 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 ZOMATO_MCP_COMMAND = os.getenv("ZOMATO_MCP_COMMAND", "uvx")
 ZOMATO_MCP_ARGS = os.getenv("ZOMATO_MCP_ARGS", "zomato-mcp").split()
+
+# Outbound Telegram rate limits (messages per second and burst size)
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "25"))
+TELEGRAM_GLOBAL_BURST = int(os.getenv("TELEGRAM_GLOBAL_BURST", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+# Sends in flight at once (across chats; each chat still sends one at a time)
+TELEGRAM_MAX_CONCURRENT_SENDS = int(os.getenv("TELEGRAM_MAX_CONCURRENT_SENDS", "8"))
+
+# Cache of first-step LLM tool-call plans (see plan_cache.py).
+# Shared across users, so it is opt-in.
+PLAN_CACHE_ENABLED = os.getenv("PLAN_CACHE_ENABLED", "false").lower() == "true"
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "600"))
+# Tools whose plans are never cached; ordering and login steps always go to the LLM
+PLAN_CACHE_DISABLED_INTENTS = [
+    name.strip() for name in
+    os.getenv("PLAN_CACHE_DISABLED_INTENTS", "create_cart,checkout_cart,login_step_1,login_step_2").split(",")
+    if name.strip()
+]
+
+# Telegram user ids allowed to run admin commands (e.g. /profile)
+ADMIN_USER_IDS = {int(uid) for uid in os.getenv("ADMIN_USER_IDS", "").split(",") if uid.strip()}
+
+# Turn profiling (see profiler.py); 0 disables
+PROFILE_NEXT_TURNS = int(os.getenv("PROFILE_NEXT_TURNS", "0"))
+PROFILE_SLOW_TURN_MS = float(os.getenv("PROFILE_SLOW_TURN_MS", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_TURNS = int(os.getenv("PROFILE_MAX_TURNS", "50"))
@@ -28,6 +28,11 @@ def init_db():
             created_at DATETIME DEFAULT CURRENT_TIMESTAMP
         )
     ''')
+    # Range scans for analytics (see analytics.py)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_created_at ON orders (created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_carts_created_at ON carts (created_at)')
+    # WAL lets long analytics reads run without blocking the bot's writes
+    cursor.execute('PRAGMA journal_mode=WAL')
     conn.commit()
     conn.close()
 
@@ -4,9 +4,12 @@ import logging
 from telegram import Update
 from telegram.ext import ApplicationBuilder, ContextTypes, CommandHandler, MessageHandler, filters
 import nest_asyncio
-from config import TELEGRAM_TOKEN
+from config import TELEGRAM_TOKEN, ADMIN_USER_IDS
 from tools import ZomatoClient
 from agent import Agent
+from outbox import outbox, PRIORITY_TRACKING
+from profiler import profiler
+from plan_cache import plan_cache
 
 nest_asyncio.apply()
 
@@ -22,7 +25,46 @@ user_agents = {}
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     user_agents[user_id] = Agent()
-    await context.bot.send_message(chat_id=update.effective_chat.id, text="Hello! I'm your Zomato AI assistant. What would you like to order today?")
+    outbox.send(update.effective_chat.id, "Hello! I'm your Zomato AI assistant. What would you like to order today?")
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Admin only.
+    /profile <n>          profile the next n turns
+    /profile slow <ms>    capture any turn slower than <ms>
+    /profile off          stop profiling
+    /profile              show status
+    """
+    chat_id = update.effective_chat.id
+    if update.effective_user.id not in ADMIN_USER_IDS:
+        outbox.send(chat_id, "This command is for admins only.")
+        return
+
+    args = context.args or []
+    try:
+        if not args:
+            pass
+        elif args[0] == "off":
+            profiler.disable()
+        elif args[0] == "slow" and len(args) == 2:
+            profiler.profile_slow(float(args[1]))
+        elif len(args) == 1:
+            profiler.profile_next(int(args[0]))
+        else:
+            raise ValueError(args)
+    except ValueError:
+        outbox.send(chat_id, "Usage: /profile <n> | /profile slow <ms> | /profile off")
+        return
+
+    saved = profiler.saved_turns()
+    outbox.send(chat_id, (
+        f"Profiling next {profiler.remaining_turns} turns, "
+        f"slow threshold: {profiler.slow_turn_ms or 'off'} ms\n"
+        f"Saved profiles: {len(saved)} in {profiler.directory}/"
+        + (f" (latest: {saved[-1]})" if saved else "") +
+        f"\nOutbox backlog: {outbox.backlog}"
+        f"\nPlan cache: {plan_cache.stats() if plan_cache.enabled else 'off'}"
+    ))
 
 async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
@@ -38,7 +80,13 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Indicate typing
     await context.bot.send_chat_action(chat_id=update.effective_chat.id, action="typing")
     
-    response = await agent.process_message(user_message)
+    # Profiling is off unless enabled via /profile or PROFILE_* env vars
+    turn = profiler.begin_turn(user_id)
+    try:
+        response = await agent.process_message(user_message, callbacks=turn.callbacks if turn else None)
+    finally:
+        # Saving the profile happens in the background; don't hold up the reply
+        profiler.end_turn(turn)
 
     # Check for QR code in response
     import re
@@ -51,29 +99,27 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Remove the internal log message from the user response so we don't show the raw path text
         response = response.replace(qr_match.group(0), "Here is your payment QR code:")
 
-    # Telegram message limit is 4096. To be safe, chunk at 4000.
-    if len(response) > 4000:
-        for i in range(0, len(response), 4000):
-            chunk = response[i:i+4000]
-            await context.bot.send_message(chat_id=update.effective_chat.id, text=chunk)
-    else:
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=response)
+    # Queued through the outbox, which splits long replies (Telegram limit is 4096)
+    # and keeps us under Telegram's rate limits.
+    outbox.send(update.effective_chat.id, response)
         
     # Send the image if found
     if image_path and os.path.exists(image_path):
         try:
-            await context.bot.send_photo(chat_id=update.effective_chat.id, photo=open(image_path, 'rb'))
+            await outbox.send_photo(update.effective_chat.id, image_path)
             # Start tracking the order automatically
             # Use asyncio.create_task for robust background execution without JobQueue dependency
+            # The QR file is named checkout_<cart_id>.png; use it to key tracking updates
+            order_key = os.path.splitext(os.path.basename(image_path))[0]
             asyncio.create_task(track_order_loop(
-                bot=context.bot,
                 chat_id=update.effective_chat.id,
-                user_id=user_id
+                user_id=user_id,
+                order_key=order_key
             ))
         except Exception as e:
-            await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Failed to send QR image: {e}")
+            outbox.send(update.effective_chat.id, f"Failed to send QR image: {e}")
 
-async def track_order_loop(bot, chat_id, user_id):
+async def track_order_loop(chat_id, user_id, order_key=None):
     """Asyncio loop for tracking orders if JobQueue is unavailable."""
     from tools import get_tracking_info
     # We need to set the user context for this task
@@ -92,7 +138,14 @@ async def track_order_loop(bot, chat_id, user_id):
             
             # Simple heuristic: report successful tracking info
             if "No active orders" not in status_info and "error" not in status_info.lower():
-                 await bot.send_message(chat_id=chat_id, text=f"🔔 Order Update:\n{status_info}")
+                 # Tracking updates yield to interactive replies; a newer update
+                 # for the same order replaces one that is still queued.
+                 outbox.send(
+                     chat_id,
+                     f"🔔 Order Update:\n{status_info}",
+                     priority=PRIORITY_TRACKING,
+                     merge_key=("tracking", chat_id, order_key or user_id)
+                 )
                  if "delivered" in status_info.lower():
                      break
             else:
@@ -124,13 +177,22 @@ async def main():
         # The 'context' in callbacks will have job_queue.
         
         start_handler = CommandHandler('start', start)
+        profile_handler = CommandHandler('profile', profile_command)
         message_handler = MessageHandler(filters.TEXT & (~filters.COMMAND), handle_message)
         
         application.add_handler(start_handler)
+        application.add_handler(profile_handler)
         application.add_handler(message_handler) # This handler handles all text messages that are not commands
         
+        # All outbound messages go through a single rate-limited dispatcher
+        outbox.start(application.bot)
+
         print("Bot is polling...")
-        await application.run_polling(close_loop=False)
+        try:
+            await application.run_polling(close_loop=False)
+        finally:
+            print(f"Stopping outbox (backlog={outbox.backlog})")
+            await outbox.stop()
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,371 @@
+import asyncio
+import heapq
+import itertools
+import time
+from telegram.error import RetryAfter
+from config import (
+    TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST,
+    TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST, TELEGRAM_MAX_CONCURRENT_SENDS,
+)
+
+# Telegram rejects messages longer than 4096 characters. To be safe, chunk at 4000.
+MAX_MESSAGE_LENGTH = 4000
+
+# How often idle per-chat buckets are swept when the queue drains (seconds)
+BUCKET_SWEEP_INTERVAL = 60
+
+# Lower value = sent first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_TRACKING = 10
+
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    """Split text into chunks of at most `limit` characters, preferring line boundaries."""
+    if len(text) <= limit:
+        return [text]
+
+    chunks = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        # A single line longer than the limit has to be hard-split
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+        if len(current) + len(line) > limit:
+            chunks.append(current)
+            current = ""
+        current += line
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `burst` tokens."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until a token is available (0 if one is available now)."""
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now):
+        """Full and not blocked: indistinguishable from a fresh bucket, so safe to drop."""
+        if now < self.blocked_until:
+            return False
+        self._refill(now)
+        return self.tokens >= self.burst
+
+    def block(self, seconds, now):
+        # Telegram told us to back off (flood wait)
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0
+
+
+class _Entry:
+    __slots__ = ("priority", "seq", "chat_id", "text", "photo", "merge_key", "future", "queued", "cancelled")
+
+    def __init__(self, priority, seq, chat_id, text, photo, merge_key, future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.text = text
+        self.photo = photo
+        self.merge_key = merge_key
+        self.future = future
+        self.queued = False
+        # Superseded by a newer message with the same merge_key
+        self.cancelled = False
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class Outbox:
+    """
+    Single outbound dispatcher for all Telegram messages.
+
+    Messages are queued by priority (interactive replies before tracking
+    notifications) and released through a global and a per-chat token bucket
+    so bursts never trip Telegram's flood limits. Queued messages sharing a
+    `merge_key` are collapsed so only the latest text is delivered.
+
+    Each chat has its own priority queue. A heap of chat heads picks the next
+    chat to serve, and chats waiting on their token bucket sit in a separate
+    heap ordered by when they become ready, so a dispatch is O(log n) however
+    large the backlog gets.
+
+    Released messages are sent as their own tasks (up to `max_concurrent`
+    at once), so a slow upload to one chat doesn't hold up the others. A chat
+    with a send in flight isn't served again until it finishes, which keeps
+    each chat's messages in order.
+    """
+
+    def __init__(self, bot=None, max_concurrent=TELEGRAM_MAX_CONCURRENT_SENDS):
+        self.bot = bot
+        self.max_concurrent = max_concurrent
+        self._seq = itertools.count()
+        self._size = 0
+        # chat_id -> heap of _Entry
+        self._chats = {}
+        # (priority, seq, chat_id) of each ready chat's head; stale tuples are skipped
+        self._heads = []
+        # (ready_at, chat_id) for chats waiting on their token bucket
+        self._blocked = []
+        self._blocked_chats = set()
+        # merge_key -> entries (all chunks) of the latest undelivered message
+        self._pending_by_key = {}
+        self._global_bucket = TokenBucket(TELEGRAM_GLOBAL_RATE, TELEGRAM_GLOBAL_BURST)
+        self._chat_buckets = {}
+        # Chats with a send in progress, and the tasks doing those sends
+        self._in_flight = set()
+        self._send_tasks = set()
+        self._last_sweep = time.monotonic()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    @property
+    def backlog(self):
+        """Number of messages queued but not yet delivered."""
+        return self._size
+
+    def start(self, bot):
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        for task in list(self._send_tasks):
+            task.cancel()
+        if self._send_tasks:
+            await asyncio.gather(*self._send_tasks, return_exceptions=True)
+
+    def send(self, chat_id, text, priority=PRIORITY_INTERACTIVE, merge_key=None):
+        """
+        Queue a text message, split on line boundaries if it is too long.
+        Returns a future resolved once the last chunk has been delivered.
+        """
+        if merge_key is not None:
+            # Drop every chunk of a stale update that is still queued
+            for stale in self._pending_by_key.pop(merge_key, []):
+                self._cancel(stale)
+
+        future = None
+        for chunk in split_message(text):
+            future = self._push(chat_id, chunk, None, priority, merge_key)
+        return future
+
+    def send_photo(self, chat_id, photo_path, priority=PRIORITY_INTERACTIVE):
+        """Queue a photo (by file path). Returns a future resolved on delivery."""
+        return self._push(chat_id, None, photo_path, priority, None)
+
+    def _push(self, chat_id, text, photo, priority, merge_key):
+        future = asyncio.get_running_loop().create_future()
+        entry = _Entry(priority, next(self._seq), chat_id, text, photo, merge_key, future)
+        self._enqueue(entry)
+        if merge_key is not None:
+            self._pending_by_key.setdefault(merge_key, []).append(entry)
+        self._wakeup.set()
+        return future
+
+    def _cancel(self, entry):
+        entry.cancelled = True
+        if entry.queued:
+            # Removed lazily when it reaches the head of its chat queue
+            entry.queued = False
+            self._size -= 1
+        if not entry.future.done():
+            entry.future.set_result(None)
+
+    def _forget(self, entry):
+        """Drop a delivered (or failed) entry from its merge group."""
+        if entry.merge_key is None:
+            return
+        group = self._pending_by_key.get(entry.merge_key)
+        if group and entry in group:
+            group.remove(entry)
+            if not group:
+                del self._pending_by_key[entry.merge_key]
+
+    def _enqueue(self, entry):
+        queue = self._chats.setdefault(entry.chat_id, [])
+        heapq.heappush(queue, entry)
+        entry.queued = True
+        self._size += 1
+        # Announce the chat if this entry became its head (unless the chat is waiting anyway)
+        if queue[0] is entry and entry.chat_id not in self._blocked_chats and entry.chat_id not in self._in_flight:
+            heapq.heappush(self._heads, (entry.priority, entry.seq, entry.chat_id))
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(TELEGRAM_CHAT_RATE, TELEGRAM_CHAT_BURST)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _next_ready(self, now):
+        """
+        Pop the highest-priority entry whose chat has a token available.
+        Returns (entry, None) or (None, seconds_to_wait).
+        """
+        # Chats whose bucket has refilled go back into the running
+        while self._blocked and self._blocked[0][0] <= now:
+            _, chat_id = heapq.heappop(self._blocked)
+            self._blocked_chats.discard(chat_id)
+            queue = self._chats.get(chat_id)
+            if queue:
+                heapq.heappush(self._heads, (queue[0].priority, queue[0].seq, chat_id))
+
+        global_wait = self._global_bucket.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+
+        while self._heads:
+            priority, seq, chat_id = heapq.heappop(self._heads)
+            queue = self._chats.get(chat_id)
+            if not queue or chat_id in self._blocked_chats or chat_id in self._in_flight or queue[0].seq != seq:
+                # Stale head: the chat was emptied, is waiting or sending, or got a newer head.
+                # Sending chats are announced again when their send finishes.
+                continue
+            if queue[0].cancelled:
+                heapq.heappop(queue)
+                self._announce_or_drop(chat_id, queue)
+                continue
+            wait = self._chat_bucket(chat_id).wait_time(now)
+            if wait > 0:
+                self._blocked_chats.add(chat_id)
+                heapq.heappush(self._blocked, (now + wait, chat_id))
+                continue
+
+            entry = heapq.heappop(queue)
+            entry.queued = False
+            self._size -= 1
+            if not queue:
+                del self._chats[chat_id]
+            return entry, None
+
+        if self._blocked:
+            return None, max(0.0, self._blocked[0][0] - now)
+        return None, None
+
+    def _announce_or_drop(self, chat_id, queue):
+        if queue:
+            heapq.heappush(self._heads, (queue[0].priority, queue[0].seq, chat_id))
+        else:
+            del self._chats[chat_id]
+            self._drop_idle_bucket(chat_id, time.monotonic())
+
+    def _drop_idle_bucket(self, chat_id, now):
+        if chat_id in self._chats or chat_id in self._in_flight or chat_id in self._blocked_chats:
+            return
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is not None and bucket.is_idle(now):
+            del self._chat_buckets[chat_id]
+
+    def _sweep_idle_buckets(self, now):
+        """Forget buckets of chats that have gone quiet, so the dict doesn't grow forever."""
+        if now - self._last_sweep < BUCKET_SWEEP_INTERVAL:
+            return
+        self._last_sweep = now
+        for chat_id in list(self._chat_buckets):
+            self._drop_idle_bucket(chat_id, now)
+
+    async def _deliver(self, entry):
+        if entry.photo is not None:
+            with open(entry.photo, 'rb') as photo:
+                await self.bot.send_photo(chat_id=entry.chat_id, photo=photo)
+        else:
+            await self.bot.send_message(chat_id=entry.chat_id, text=entry.text)
+
+    async def _run(self):
+        while True:
+            # _in_flight (not _send_tasks) is updated before the finishing send wakes us up
+            if not self._size or len(self._in_flight) >= self.max_concurrent:
+                # Nothing to send, or at the concurrency limit: wait for a new message or a finished send
+                if not self._size:
+                    self._sweep_idle_buckets(time.monotonic())
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            entry, wait = self._next_ready(now)
+            if entry is None:
+                self._wakeup.clear()
+                try:
+                    # Sleep until a token frees up, or until a new message arrives
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self._global_bucket.consume(now)
+            self._chat_bucket(entry.chat_id).consume(now)
+            self._in_flight.add(entry.chat_id)
+            task = asyncio.create_task(self._send(entry))
+            self._send_tasks.add(task)
+            task.add_done_callback(self._send_tasks.discard)
+
+    async def _send(self, entry):
+        try:
+            await self._deliver(entry)
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if hasattr(retry_after, "total_seconds"):
+                retry_after = retry_after.total_seconds()
+            print(f"DEBUG: Flood wait of {retry_after}s for chat {entry.chat_id}, backlog={self.backlog}")
+            self._chat_bucket(entry.chat_id).block(retry_after, time.monotonic())
+            if not entry.cancelled:
+                # Requeue with the same seq so ordering within the chat is kept
+                self._enqueue(entry)
+        except Exception as e:
+            self._forget(entry)
+            print(f"DEBUG: Failed to send message to chat {entry.chat_id}: {e}")
+            if not entry.future.done():
+                entry.future.set_exception(e)
+                # Already logged; don't warn again if nobody awaits the future
+                entry.future.exception()
+        else:
+            self._forget(entry)
+            if not entry.future.done():
+                entry.future.set_result(None)
+        finally:
+            self._in_flight.discard(entry.chat_id)
+            queue = self._chats.get(entry.chat_id)
+            if not queue:
+                self._drop_idle_bucket(entry.chat_id, time.monotonic())
+            elif entry.chat_id not in self._blocked_chats:
+                heapq.heappush(self._heads, (queue[0].priority, queue[0].seq, entry.chat_id))
+            self._wakeup.set()
+
+
+# Shared dispatcher, started from main()
+outbox = Outbox()
@@ -0,0 +1,267 @@
+import hashlib
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, List, Union
+
+from langchain.agents.agent import RunnableMultiActionAgent
+from langchain.agents.output_parsers.tools import ToolAgentAction
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.messages import AIMessage
+
+from config import PLAN_CACHE_ENABLED, PLAN_CACHE_SIZE, PLAN_CACHE_TTL, PLAN_CACHE_DISABLED_INTENTS
+
+# Conversation state slots the agent remembers between turns.
+# Cached plans refer to these by placeholder, never by value, so a plan
+# learned from one user can be replayed for another.
+STATE_SLOTS = ("address_id", "res_id", "cart_id")
+PLACEHOLDER_PREFIX = "$state:"
+# Print hit/miss counts every this many lookups
+STATS_LOG_EVERY = 100
+
+
+def normalize_input(text):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+
+# Replies whose meaning depends entirely on what the assistant just asked
+CONTEXT_DEPENDENT_REPLIES = {
+    "yes", "y", "yeah", "yep", "yup", "sure", "ok", "okay", "k", "no", "nope", "n",
+    "confirm", "confirmed", "go ahead", "proceed", "done", "that one", "this one",
+}
+
+
+def is_cacheable_input(text):
+    """Skip bare confirmations and numeric picks ("yes", "2"); they mean nothing without context."""
+    normalized = normalize_input(text)
+    if not normalized or normalized in CONTEXT_DEPENDENT_REPLIES:
+        return False
+    return re.fullmatch(r"[\d\s.,#()-]+", normalized) is None
+
+
+# Words that point back at something the assistant just said ("add that", "the first one")
+CONTEXT_REFERENCES = {
+    "it", "its", "that", "this", "these", "those", "them", "they", "there", "one", "ones",
+    "same", "more", "another", "next", "previous", "above", "first", "second", "third", "last",
+}
+
+
+def refers_to_context(text):
+    """True if the input leans on the previous reply, so the plan depends on it."""
+    return any(token in CONTEXT_REFERENCES for token in re.findall(r"\w+", normalize_input(text)))
+
+
+def last_reply_digest(chat_history):
+    """Short hash of the last assistant message, or None at the start of a conversation."""
+    for message in reversed(chat_history or []):
+        if isinstance(message, AIMessage):
+            content = message.content if isinstance(message.content, str) else str(message.content)
+            return hashlib.sha1(content.encode("utf-8")).hexdigest()[:16]
+    return None
+
+
+def state_fingerprint(state):
+    """Which slots are filled (not their values) plus the last tool used."""
+    filled = tuple(slot for slot in STATE_SLOTS if state.get(slot) is not None)
+    return filled, state.get("last_tool")
+
+
+class PlanCache:
+    """
+    LRU + TTL cache of first-step tool-call plans, keyed on the normalized
+    user input and the structured conversation state. Inputs that refer back
+    to the conversation ("show it", "the first one") are also keyed on the
+    last assistant reply; self-contained ones are not, so they still hit
+    mid-conversation.
+    """
+
+    def __init__(self, max_size=PLAN_CACHE_SIZE, ttl=PLAN_CACHE_TTL, disabled_intents=PLAN_CACHE_DISABLED_INTENTS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.enabled = PLAN_CACHE_ENABLED
+        self.disabled_intents = set(disabled_intents)
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def disable_intent(self, tool_name):
+        self.disabled_intents.add(tool_name)
+
+    def enable_intent(self, tool_name):
+        self.disabled_intents.discard(tool_name)
+
+    def clear(self):
+        self._entries.clear()
+
+    def make_key(self, context, user_input, state, chat_history=None):
+        reply = last_reply_digest(chat_history) if refers_to_context(user_input) else None
+        return (context, normalize_input(user_input), state_fingerprint(state), reply)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return f"{self.hits} hits / {self.misses} misses ({self.hit_rate:.0%}), {len(self._entries)} plans"
+
+    def get(self, key):
+        """Return the cached plan (list of (tool, templated_args)) or None."""
+        if not self.enabled:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return self._miss()
+        stored_at, plan = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return self._miss()
+        if any(tool in self.disabled_intents for tool, _ in plan):
+            return self._miss()
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self._log_stats()
+        return plan
+
+    def _miss(self):
+        self.misses += 1
+        self._log_stats()
+        return None
+
+    def _log_stats(self):
+        if (self.hits + self.misses) % STATS_LOG_EVERY == 0:
+            print(f"DEBUG: Plan cache: {self.stats()}")
+
+    def put(self, key, plan):
+        if not self.enabled or not plan:
+            return
+        if any(tool in self.disabled_intents for tool, _ in plan):
+            return
+        self._entries[key] = (time.monotonic(), plan)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+def _tokens(text):
+    return re.findall(r"\w+", str(text).lower())
+
+
+def _in_input(value, input_tokens):
+    """True if `value` appears in the input as whole token(s), e.g. "10" but not "1" in "show 10 places"."""
+    value_tokens = _tokens(value)
+    n = len(value_tokens)
+    if not n:
+        return False
+    return any(input_tokens[i:i + n] == value_tokens for i in range(len(input_tokens) - n + 1))
+
+
+def template_args(args, user_input, state):
+    """
+    Replace state values in tool args with placeholders.
+
+    Values the user typed are kept literally (they are part of the cache key),
+    so only values absent from the input are templated. Returns None if an
+    argument can't be safely shared across users, i.e. a string that neither
+    comes from the input nor the state, an id that isn't a state slot, or a
+    structured value (e.g. cart items).
+    """
+    input_tokens = _tokens(normalize_input(user_input))
+    templated = {}
+    for name, value in args.items():
+        if value is None or isinstance(value, bool):
+            templated[name] = value
+        elif isinstance(value, (str, int, float)) and _in_input(value, input_tokens):
+            templated[name] = value
+        elif name in STATE_SLOTS and state.get(name) is not None and str(state[name]) == str(value):
+            templated[name] = PLACEHOLDER_PREFIX + name
+        elif isinstance(value, (int, float)) and not name.endswith("_id"):
+            # Plain numeric options such as `limit`
+            templated[name] = value
+        else:
+            return None
+    return templated
+
+
+def fill_args(templated, state):
+    """Inverse of template_args. Returns None if a referenced slot is empty."""
+    args = {}
+    for name, value in templated.items():
+        if isinstance(value, str) and value.startswith(PLACEHOLDER_PREFIX):
+            slot = value[len(PLACEHOLDER_PREFIX):]
+            if state.get(slot) is None:
+                return None
+            value = state[slot]
+        args[name] = value
+    return args
+
+
+class CachedPlanAgent(RunnableMultiActionAgent):
+    """
+    Tool-calling agent that answers the first step of a turn from the plan
+    cache when it can, skipping one LLM round-trip. Later steps, and any
+    step whose plan isn't cached, go to the LLM as usual.
+    """
+
+    plan_cache: Any
+    cache_context: Any = None
+    state: dict = {}
+
+    async def aplan(
+        self,
+        intermediate_steps,
+        callbacks=None,
+        **kwargs: Any,
+    ) -> Union[List[AgentAction], AgentFinish]:
+        if intermediate_steps or "input" not in kwargs or not is_cacheable_input(kwargs["input"]):
+            return await super().aplan(intermediate_steps, callbacks=callbacks, **kwargs)
+
+        user_input = kwargs["input"]
+        key = self.plan_cache.make_key(self.cache_context, user_input, self.state, kwargs.get("chat_history"))
+        plan = self.plan_cache.get(key)
+        if plan is not None:
+            actions = self._replay(plan)
+            if actions is not None:
+                print(f"DEBUG: Plan cache hit for '{normalize_input(user_input)}' -> {[a.tool for a in actions]}")
+                return actions
+
+        output = await super().aplan(intermediate_steps, callbacks=callbacks, **kwargs)
+        if isinstance(output, list) and output and all(isinstance(a, ToolAgentAction) for a in output):
+            plan = []
+            for action in output:
+                if not isinstance(action.tool_input, dict):
+                    return output
+                templated = template_args(action.tool_input, user_input, self.state)
+                if templated is None:
+                    return output
+                plan.append((action.tool, templated))
+            self.plan_cache.put(key, tuple(plan))
+        return output
+
+    def _replay(self, plan):
+        tool_calls = []
+        for tool_name, templated in plan:
+            args = fill_args(templated, self.state)
+            if args is None:
+                return None
+            tool_calls.append({"name": tool_name, "args": args, "id": f"call_{uuid.uuid4().hex[:24]}"})
+
+        # Rebuild the message the LLM would have produced, without its text
+        message = AIMessage(content="", tool_calls=tool_calls)
+        return [
+            ToolAgentAction(
+                tool=call["name"],
+                tool_input=call["args"],
+                log=f"\nInvoking: `{call['name']}` with `{call['args']}`\n(cached plan)\n",
+                message_log=[message],
+                tool_call_id=call["id"],
+            )
+            for call in tool_calls
+        ]
+
+
+# Shared across all users; entries never contain user-specific values
+plan_cache = PlanCache()
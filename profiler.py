@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from langchain_core.callbacks import AsyncCallbackHandler
+from config import (
+    PROFILE_NEXT_TURNS, PROFILE_SLOW_TURN_MS, PROFILE_SAMPLE_INTERVAL_MS,
+    PROFILE_DIR, PROFILE_MAX_TURNS,
+)
+
+# On-demand turn profiling.
+#
+# When enabled (for the next N turns, or for turns slower than a threshold),
+# a sampler thread snapshots the event loop thread's stack every few
+# milliseconds and a LangChain callback records a timeline of LLM and tool
+# calls. Captured turns are written to PROFILE_DIR as:
+#   turn_<ts>_<user>.folded  - collapsed stacks (flamegraph.pl / speedscope)
+#   turn_<ts>_<user>.json    - per-turn timeline and summary
+# Only the last PROFILE_MAX_TURNS turns are kept.
+#
+# When disabled, begin_turn() is a couple of attribute checks and nothing else runs.
+# While slow-turn capture is armed, every turn is sampled (we can't know in
+# advance which ones will be slow); only the slow ones are written.
+# Turns run concurrently on one event loop, so overlapping turns share samples.
+
+MAX_STACK_DEPTH = 128
+
+
+class TimelineHandler(AsyncCallbackHandler):
+    """Records start/end of every LLM and tool call in a turn."""
+
+    def __init__(self, started):
+        self.started = started
+        self.events = []
+        self._open = {}
+
+    def _now_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def _start(self, run_id, kind, name):
+        self._open[run_id] = {"kind": kind, "name": name, "start_ms": round(self._now_ms(), 1)}
+
+    def _end(self, run_id, error=None):
+        event = self._open.pop(run_id, None)
+        if event is None:
+            return
+        event["duration_ms"] = round(self._now_ms() - event["start_ms"], 1)
+        if error is not None:
+            event["error"] = str(error)
+        self.events.append(event)
+
+    async def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._start(run_id, "llm", (serialized or {}).get("name") or "chat_model")
+
+    async def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._start(run_id, "llm", (serialized or {}).get("name") or "llm")
+
+    async def on_llm_end(self, response, *, run_id, **kwargs):
+        self._end(run_id)
+
+    async def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, "tool", (serialized or {}).get("name") or "tool")
+
+    async def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id)
+
+    async def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+class TurnProfile:
+    def __init__(self, user_id, forced):
+        self.user_id = user_id
+        # Captured regardless of duration (counted against "next N turns")
+        self.forced = forced
+        self.wall_started = time.time()
+        self.started = time.perf_counter()
+        self.duration_ms = None
+        self.stacks = Counter()
+        self.timeline = TimelineHandler(self.started)
+
+    @property
+    def callbacks(self):
+        return [self.timeline]
+
+
+class _Sampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval."""
+
+    def __init__(self, target_thread_id, interval, turns, lock):
+        super().__init__(name="turn-profiler", daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.turns = turns
+        self.lock = lock
+        self.stop_event = threading.Event()
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < MAX_STACK_DEPTH:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            del frame
+            with self.lock:
+                for turn in self.turns:
+                    turn.stacks[stack] += 1
+
+
+class Profiler:
+    def __init__(self):
+        self.remaining_turns = PROFILE_NEXT_TURNS
+        self.slow_turn_ms = PROFILE_SLOW_TURN_MS
+        self.interval = PROFILE_SAMPLE_INTERVAL_MS / 1000
+        self.directory = PROFILE_DIR
+        self.max_turns = PROFILE_MAX_TURNS
+        self._active_turns = []
+        self._lock = threading.Lock()
+        self._sampler = None
+        # Background profile writes; serialized so ring-buffer eviction doesn't race
+        self._write_lock = threading.Lock()
+        self._pending_writes = set()
+
+    @property
+    def enabled(self):
+        return self.remaining_turns > 0 or self.slow_turn_ms > 0
+
+    def profile_next(self, turns):
+        self.remaining_turns = max(0, turns)
+
+    def profile_slow(self, threshold_ms):
+        self.slow_turn_ms = max(0, threshold_ms)
+
+    def disable(self):
+        self.remaining_turns = 0
+        self.slow_turn_ms = 0
+
+    def begin_turn(self, user_id):
+        """Start profiling a turn. Returns a TurnProfile, or None when profiling is off."""
+        if not self.enabled:
+            return None
+
+        forced = self.remaining_turns > 0
+        if forced:
+            self.remaining_turns -= 1
+        turn = TurnProfile(user_id, forced)
+        with self._lock:
+            self._active_turns.append(turn)
+        if self._sampler is None:
+            self._sampler = _Sampler(threading.get_ident(), self.interval, self._active_turns, self._lock)
+            self._sampler.start()
+        return turn
+
+    def end_turn(self, turn):
+        """
+        Stop profiling a turn. If it was requested or slow, schedule writing it
+        in the background (so the reply isn't held up) and return that task.
+        """
+        if turn is None:
+            return None
+
+        turn.duration_ms = (time.perf_counter() - turn.started) * 1000
+        with self._lock:
+            self._active_turns.remove(turn)
+            idle = not self._active_turns
+        if idle and self._sampler is not None:
+            self._sampler.stop_event.set()
+            self._sampler = None
+
+        slow = self.slow_turn_ms > 0 and turn.duration_ms >= self.slow_turn_ms
+        if not (turn.forced or slow):
+            return None
+        task = asyncio.create_task(self._save(turn))
+        self._pending_writes.add(task)
+        task.add_done_callback(self._pending_writes.discard)
+        return task
+
+    async def _save(self, turn):
+        try:
+            # Keep file I/O off the event loop
+            return await asyncio.to_thread(self._write, turn)
+        except Exception as e:
+            print(f"DEBUG: Failed to write turn profile: {e}")
+            return None
+
+    def _write(self, turn):
+        with self._write_lock:
+            return self._write_locked(turn)
+
+    def _write_locked(self, turn):
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(turn.wall_started))
+        base = os.path.join(self.directory, f"turn_{stamp}_{int(turn.wall_started * 1000) % 1000:03d}_{turn.user_id}")
+
+        with open(base + ".folded", "w", encoding="utf-8") as f:
+            for stack, count in turn.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+        timeline = sorted(turn.timeline.events, key=lambda e: e["start_ms"])
+        summary = {
+            "user_id": turn.user_id,
+            "started_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(turn.wall_started)),
+            "duration_ms": round(turn.duration_ms, 1),
+            "llm_ms": round(sum(e["duration_ms"] for e in timeline if e["kind"] == "llm"), 1),
+            "tool_ms": round(sum(e["duration_ms"] for e in timeline if e["kind"] == "tool"), 1),
+            "samples": sum(turn.stacks.values()),
+            "sample_interval_ms": self.interval * 1000,
+            "timeline": timeline,
+        }
+        with open(base + ".json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+        self._evict()
+        print(f"DEBUG: Saved turn profile to {base}.json ({summary['duration_ms']} ms)")
+        return base
+
+    def _evict(self):
+        # Ring buffer: one .json + .folded pair per turn, oldest first by name
+        bases = sorted({
+            os.path.splitext(name)[0] for name in os.listdir(self.directory)
+            if name.startswith("turn_") and name.endswith((".json", ".folded"))
+        })
+        for base in bases[:-self.max_turns] if self.max_turns > 0 else bases:
+            for ext in (".json", ".folded"):
+                path = os.path.join(self.directory, base + ext)
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def saved_turns(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory) if name.startswith("turn_") and name.endswith(".json"))
+
+
+# Shared profiler, controlled by the /profile admin command or PROFILE_* env vars
+profiler = Profiler()
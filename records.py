@@ -0,0 +1,271 @@
+import json
+import sys
+from collections import OrderedDict
+from typing import NamedTuple, Optional, Tuple
+
+# Compact, tuple-backed records for MCP payloads.
+# The decoded JSON trees are large and deeply nested; we keep only the
+# fields the bot actually uses and let the rest be garbage collected.
+
+
+class Restaurant(NamedTuple):
+    res_id: object
+    name: str
+    rating: object
+    delivery_time: object
+
+
+class Variant(NamedTuple):
+    variant_id: str
+    name: str
+    price: object
+
+
+class MenuItem(NamedTuple):
+    item_id: str
+    name: str
+    price: object
+    variants: Tuple[Variant, ...]
+
+
+class Address(NamedTuple):
+    address_id: object
+    label: str
+    text: str
+
+
+class TrackingEntry(NamedTuple):
+    order_id: object
+    status: str
+
+
+def _loads(content):
+    if isinstance(content, (dict, list)):
+        return content
+    try:
+        return json.loads(content)
+    except (TypeError, ValueError):
+        return None
+
+
+def _first(d, *keys, default=None):
+    for key in keys:
+        value = d.get(key)
+        if value is not None:
+            return value
+    return default
+
+
+# --- Restaurants ---
+
+def parse_restaurant(item) -> Restaurant:
+    info = item.get("info", item)
+    rating = info.get("rating")
+    if isinstance(rating, dict):
+        rating = rating.get("aggregate_rating", "N/A")
+    elif rating is None:
+        rating = "N/A"
+    order = info.get("order")
+    delivery_time = order.get("delivery_time", "N/A") if isinstance(order, dict) else "N/A"
+    return Restaurant(info.get("res_id", "N/A"), info.get("name", "Unknown"), rating, delivery_time)
+
+
+def parse_restaurant_search(content):
+    """
+    Parse a get_restaurants_for_keyword payload.
+    Returns (restaurants, postback_params), or None if the payload isn't JSON.
+    """
+    data = _loads(content)
+    if data is None:
+        return None
+
+    if isinstance(data, list):
+        # Plain list: keep every item as-is (missing ids show as "N/A")
+        restaurants = tuple(parse_restaurant(item) for item in data if isinstance(item, dict))
+        return restaurants, None
+    if not isinstance(data, dict):
+        return None
+
+    # Zomato sometimes puts promoted stats in 'restaurants' and organic in 'sections'
+    raw_items = list(data.get("restaurants") or [])
+    sections = data.get("sections") or {}
+    raw_items.extend(sections.get("SECTION_SEARCH_RESULT") or [])
+
+    # Deduplicate by res_id (items without one are dropped)
+    seen_ids = set()
+    restaurants = []
+    for item in raw_items:
+        if not isinstance(item, dict):
+            continue
+        rid = item.get("info", item).get("res_id")
+        if rid and rid not in seen_ids:
+            seen_ids.add(rid)
+            restaurants.append(parse_restaurant(item))
+    return tuple(restaurants), data.get("postback_params")
+
+
+# --- Menu ---
+
+def _parse_variant(v) -> Optional[Variant]:
+    variant_id = _first(v, "variant_id", "id")
+    if variant_id is None:
+        return None
+    # Variant names ("Regular", "Large", ...) repeat across every dish; share one copy
+    name = v.get("name")
+    name = sys.intern(name) if isinstance(name, str) else ""
+    return Variant(str(variant_id), name, _first(v, "price", "display_price"))
+
+
+def _parse_menu_item(d) -> MenuItem:
+    variants = tuple(
+        variant for variant in (_parse_variant(v) for v in d.get("variants") or [] if isinstance(v, dict))
+        if variant
+    )
+    return MenuItem(
+        str(_first(d, "item_id", "id", "catalogue_id")),
+        d.get("name", "Unknown"),
+        _first(d, "price", "display_price"),
+        variants,
+    )
+
+
+def _looks_like_item(d):
+    return (
+        "name" in d
+        and _first(d, "item_id", "id", "catalogue_id") is not None
+        and ("variants" in d or "price" in d)
+    )
+
+
+def parse_menu(content) -> Optional[Tuple[MenuItem, ...]]:
+    """
+    Parse a get_menu_items_listing payload into menu items.
+    The listing nests items under categories/sections, so walk the tree
+    and pick up every dict that looks like an item.
+    """
+    data = _loads(content)
+    if data is None:
+        return None
+
+    items = []
+    stack = [data]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            if _looks_like_item(node):
+                items.append(_parse_menu_item(node))
+                continue
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return tuple(items)
+
+
+# --- Addresses ---
+
+def parse_addresses(content) -> Optional[Tuple[Address, ...]]:
+    """Parse saved addresses. Returns None if the payload shape isn't recognised."""
+    data = _loads(content)
+    if isinstance(data, dict):
+        # Unknown shape -> None ("don't know"), not () ("no addresses")
+        data = _first(data, "addresses", "saved_addresses")
+    if not isinstance(data, list):
+        return None
+
+    addresses = []
+    for a in data:
+        if not isinstance(a, dict):
+            continue
+        address_id = _first(a, "address_id", "id")
+        if address_id is None:
+            continue
+        addresses.append(Address(
+            address_id,
+            _first(a, "label", "name", "alias", default=""),
+            _first(a, "display_address", "address", "full_address", default=""),
+        ))
+    return tuple(addresses)
+
+
+# --- Tracking ---
+
+def parse_tracking(content) -> Optional[Tuple[TrackingEntry, ...]]:
+    data = _loads(content)
+    if not isinstance(data, list):
+        return None
+
+    entries = []
+    for order in data:
+        if not isinstance(order, dict):
+            continue
+        # Zomato uses order_id usually after checkout
+        order_id = order.get("cart_id") or order.get("order_id")
+        if "order_status" in order:
+            status = order["order_status"]
+        elif "status" in order:
+            status = order["status"]
+        else:
+            status = "unknown"
+        entries.append(TrackingEntry(order_id, status))
+    return tuple(entries)
+
+
+# --- Shared cache of parsed menus ---
+# get_menu parses the listing once; create_cart reuses it to resolve variants.
+
+MENU_CACHE_SIZE = 32
+_menus = OrderedDict()
+
+
+def remember_menu(res_id, items):
+    key = str(res_id)
+    _menus[key] = items
+    _menus.move_to_end(key)
+    while len(_menus) > MENU_CACHE_SIZE:
+        _menus.popitem(last=False)
+
+
+def lookup_menu(res_id):
+    key = str(res_id)
+    items = _menus.get(key)
+    if items is not None:
+        _menus.move_to_end(key)
+    return items
+
+
+def find_menu_item(res_id, item_id):
+    items = lookup_menu(res_id)
+    if not items:
+        return None
+    item_id = str(item_id)
+    for item in items:
+        if item.item_id == item_id:
+            return item
+    return None
+
+
+# --- Shared cache of parsed saved addresses ---
+# get_saved_addresses stores each user's addresses; the agent checks
+# address_id against them before remembering it in its state.
+
+ADDRESS_CACHE_SIZE = 1024
+_addresses = OrderedDict()
+
+
+def remember_addresses(user_id, addresses):
+    _addresses[user_id] = addresses
+    _addresses.move_to_end(user_id)
+    while len(_addresses) > ADDRESS_CACHE_SIZE:
+        _addresses.popitem(last=False)
+
+
+def lookup_addresses(user_id):
+    return _addresses.get(user_id)
+
+
+def is_known_address(user_id, address_id):
+    """True/False if the user's addresses have been fetched, None if unknown."""
+    addresses = lookup_addresses(user_id)
+    if addresses is None:
+        return None
+    return any(str(a.address_id) == str(address_id) for a in addresses)
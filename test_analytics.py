@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+import sqlite3
+
+import pytest
+
+import analytics
+import database
+
+ORDERS = [
+    # (user_id, cart_id, restaurant_id, status, created_at)
+    (1, "c1", "10", "cart_created", "2024-01-01 09:05:00"),
+    (1, "c2", "10", "pending_payment", "2024-01-01 09:40:00"),
+    (2, "c3", "20", "preparing", "2024-01-01 10:15:00"),
+    (2, "c4", "10", "Delivered", "2024-01-02 12:00:00"),
+    (3, "c5", "20", "cancelled", "2024-01-02 12:30:00"),
+    (3, "c6", "30", None, "2024-01-03 08:00:00"),
+    (3, "c7", "30", "unknown", "2024-01-03 08:10:00"),
+]
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # A '#' in the name checks the read-only URI is built safely
+    path = tmp_path / "orders#test.db"
+    monkeypatch.setattr(database, "DB_NAME", str(path))
+    database.init_db()
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO orders (user_id, cart_id, restaurant_id, items, status, created_at) VALUES (?, ?, ?, '[]', ?, ?)",
+        ORDERS,
+    )
+    conn.executemany(
+        "INSERT INTO carts (user_id, cart_id, restaurant_id, items, created_at) VALUES (?, ?, ?, '[]', ?)",
+        [(user_id, cart_id, res_id, created_at) for user_id, cart_id, res_id, _, created_at in ORDERS],
+    )
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = analytics.connect_readonly(db_path)
+    yield conn
+    conn.close()
+
+
+def test_connection_is_read_only(conn):
+    with pytest.raises(sqlite3.OperationalError):
+        conn.execute("DELETE FROM orders")
+
+
+def test_iter_rows_streams_in_batches_and_filters_by_date(conn):
+    rows = list(analytics.iter_rows(conn, "orders", ["cart_id"], batch_size=2))
+    assert sorted(row[0] for row in rows) == [f"c{i}" for i in range(1, 8)]
+
+    rows = list(analytics.iter_rows(conn, "orders", ["cart_id"], since="2024-01-02", until="2024-01-03"))
+    assert sorted(row[0] for row in rows) == ["c4", "c5"]
+
+
+def test_iter_rows_rejects_unknown_names(conn):
+    with pytest.raises(ValueError):
+        list(analytics.iter_rows(conn, "users"))
+    with pytest.raises(ValueError):
+        list(analytics.iter_rows(conn, "orders", ["id; DROP TABLE orders"]))
+
+
+def test_summarize_orders(conn):
+    summary = analytics.summarize(conn, "orders", batch_size=3)
+    assert summary["total"] == 7
+    assert summary["per_restaurant"] == {"10": 3, "20": 2, "30": 2}
+    assert summary["hourly_volume"] == {
+        "2024-01-01 09": 2, "2024-01-01 10": 1, "2024-01-02 12": 2, "2024-01-03 08": 2,
+    }
+    funnel = summary["funnel"]
+    assert (funnel["cart_created"], funnel["pending_payment"], funnel["delivered"]) == (7, 3, 1)
+    assert funnel["other"] == {"cancelled": 1, None: 1, "unknown": 1}
+
+
+def test_summarize_carts_has_no_funnel(conn):
+    summary = analytics.summarize(conn, "carts", since="2024-01-03")
+    assert summary["total"] == 2
+    assert "funnel" not in summary
+
+
+def test_export_csv(conn):
+    output = io.StringIO()
+    count = analytics.export(conn, "orders", "csv", output, batch_size=3)
+    rows = list(csv.reader(io.StringIO(output.getvalue())))
+    assert count == 7
+    assert rows[0] == list(analytics.TABLE_COLUMNS["orders"])
+    assert len(rows) == 8
+
+
+def test_export_jsonl(conn):
+    output = io.StringIO()
+    count = analytics.export(conn, "carts", "jsonl", output, since="2024-01-02", batch_size=1)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert count == len(records) == 4
+    assert {r["cart_id"] for r in records} == {"c4", "c5", "c6", "c7"}
+    assert records[0]["items"] == "[]"
+
+
+def test_export_rejects_unknown_format(conn):
+    with pytest.raises(ValueError):
+        analytics.export(conn, "orders", "xml", io.StringIO())
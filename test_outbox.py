@@ -0,0 +1,158 @@
+import asyncio
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("telegram")
+
+from telegram.error import RetryAfter
+
+import outbox as outbox_module
+from outbox import Outbox, PRIORITY_INTERACTIVE, PRIORITY_TRACKING, split_message
+
+
+@pytest.fixture(autouse=True)
+def fast_buckets(monkeypatch):
+    # Rate limits high enough that tests never wait on a bucket
+    monkeypatch.setattr(outbox_module, "TELEGRAM_GLOBAL_RATE", 10000)
+    monkeypatch.setattr(outbox_module, "TELEGRAM_GLOBAL_BURST", 10000)
+    monkeypatch.setattr(outbox_module, "TELEGRAM_CHAT_RATE", 10000)
+    monkeypatch.setattr(outbox_module, "TELEGRAM_CHAT_BURST", 10000)
+
+
+class FakeBot:
+    def __init__(self, flood_on=()):
+        self.sent = []
+        # Texts that raise RetryAfter the first time they are sent
+        self.flood_on = set(flood_on)
+
+    async def send_message(self, chat_id, text):
+        if text in self.flood_on:
+            self.flood_on.discard(text)
+            raise RetryAfter(0)
+        self.sent.append((chat_id, text))
+        await asyncio.sleep(0)
+
+
+async def _drain(outbox):
+    for _ in range(500):
+        if not outbox.backlog and not outbox._in_flight:
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"outbox did not drain, backlog={outbox.backlog}")
+
+
+def _run(queue_messages, bot=None, max_concurrent=8):
+    """Queue messages with the dispatcher stopped, then start it and drain."""
+    bot = bot or FakeBot()
+
+    async def scenario():
+        outbox = Outbox(max_concurrent=max_concurrent)
+        result = queue_messages(outbox)
+        queued = outbox.backlog
+        outbox.start(bot)
+        await _drain(outbox)
+        await outbox.stop()
+        return outbox, queued, result
+
+    outbox, queued, result = asyncio.run(scenario())
+    return bot, outbox, queued, result
+
+
+def test_split_message_short_text_is_untouched():
+    assert split_message("hello\nworld", limit=20) == ["hello\nworld"]
+
+
+def test_split_message_prefers_line_boundaries():
+    text = "\n".join(f"line {i}" for i in range(10))
+    chunks = split_message(text, limit=20)
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    # Every chunk but the last ends on a line boundary
+    assert all(chunk.endswith("\n") for chunk in chunks[:-1])
+
+
+def test_split_message_hard_splits_overlong_lines():
+    text = "short\n" + "x" * 45 + "\nend"
+    chunks = split_message(text, limit=20)
+    assert "".join(chunks) == text
+    assert all(len(chunk) <= 20 for chunk in chunks)
+
+
+def test_interactive_replies_go_before_tracking_across_chats():
+    def queue(outbox):
+        outbox.send(1, "tracking", priority=PRIORITY_TRACKING)
+        outbox.send(2, "reply", priority=PRIORITY_INTERACTIVE)
+
+    bot, _, _, _ = _run(queue, max_concurrent=1)
+    assert bot.sent == [(2, "reply"), (1, "tracking")]
+
+
+def test_messages_within_a_chat_stay_in_order():
+    def queue(outbox):
+        for i in range(5):
+            outbox.send(1, f"a{i}")
+            outbox.send(2, f"b{i}")
+
+    bot, _, _, _ = _run(queue)
+    assert [text for chat, text in bot.sent if chat == 1] == [f"a{i}" for i in range(5)]
+    assert [text for chat, text in bot.sent if chat == 2] == [f"b{i}" for i in range(5)]
+
+
+def test_merge_key_keeps_only_latest_update():
+    def queue(outbox):
+        return [outbox.send(1, f"update {i}", priority=PRIORITY_TRACKING, merge_key="order-1") for i in range(3)]
+
+    bot, _, queued, futures = _run(queue)
+    assert queued == 1
+    assert bot.sent == [(1, "update 2")]
+    assert all(f.done() for f in futures)
+
+
+def test_merge_key_drops_every_chunk_of_a_multi_chunk_update(monkeypatch):
+    monkeypatch.setattr(outbox_module, "MAX_MESSAGE_LENGTH", 10)
+    long_update = "\n".join(f"row {i}" for i in range(6))
+
+    def queue(outbox):
+        outbox.send(1, "old:\n" + long_update, merge_key="order-1")
+        outbox.send(1, "new:\n" + long_update, merge_key="order-1")
+
+    bot, _, queued, _ = _run(queue)
+    texts = [text for _, text in bot.sent]
+    assert queued == len(split_message("new:\n" + long_update))
+    assert texts[0].startswith("new:")
+    assert not any(text.startswith("old:") for text in texts)
+
+
+def test_retry_after_requeues_in_order():
+    bot = FakeBot(flood_on={"m0"})
+
+    def queue(outbox):
+        for i in range(3):
+            outbox.send(1, f"m{i}")
+
+    bot, outbox, _, _ = _run(queue, bot=bot)
+    assert bot.sent == [(1, "m0"), (1, "m1"), (1, "m2")]
+    assert outbox.backlog == 0
+
+
+def test_backlog_counts_queued_messages():
+    def queue(outbox):
+        outbox.send(1, "a")
+        outbox.send(2, "b")
+        outbox.send(1, "c", merge_key="k")
+        outbox.send(1, "d", merge_key="k")
+
+    _, outbox, queued, _ = _run(queue)
+    assert queued == 3
+    assert outbox.backlog == 0
+
+
+def test_idle_chat_buckets_are_dropped():
+    def queue(outbox):
+        for chat_id in range(20):
+            outbox.send(chat_id, "hi")
+
+    _, outbox, _, _ = _run(queue)
+    outbox._last_sweep = float("-inf")
+    outbox._sweep_idle_buckets(outbox_module.time.monotonic() + 60)
+    assert outbox._chat_buckets == {}
@@ -0,0 +1,156 @@
+import asyncio
+import pytest
+
+pytest.importorskip("dotenv")
+pytest.importorskip("langchain")
+
+from langchain.agents.output_parsers.tools import ToolAgentAction
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from plan_cache import CachedPlanAgent, PlanCache, fill_args, is_cacheable_input, template_args
+
+
+def test_template_and_fill_round_trip():
+    state = {"address_id": "addr1", "res_id": 55}
+    args = {"keyword": "pizza", "address_id": "addr1", "limit": 20}
+    templated = template_args(args, "Show pizza places", state)
+    assert templated == {"keyword": "pizza", "address_id": "$state:address_id", "limit": 20}
+    assert fill_args(templated, state) == args
+    assert fill_args(templated, {"address_id": "addr2"}) == {**args, "address_id": "addr2"}
+    assert fill_args(templated, {}) is None
+
+
+def test_typed_id_stays_literal_even_if_it_matches_state():
+    state = {"res_id": 123, "address_id": "addr1"}
+    templated = template_args({"res_id": 123, "address_id": "addr1"}, "show menu of 123", state)
+    assert templated == {"res_id": 123, "address_id": "$state:address_id"}
+    # Another user with a different restaurant in state still gets 123
+    assert fill_args(templated, {"res_id": 999, "address_id": "addr2"}) == {"res_id": 123, "address_id": "addr2"}
+
+
+def test_input_match_is_whole_token():
+    assert template_args({"res_id": 1}, "show 10 places", {}) is None
+    assert template_args({"keyword": "a"}, "show pizza places", {}) is None
+    assert template_args({"keyword": "domino's"}, "Menu of Domino's?", {}) == {"keyword": "domino's"}
+
+
+def test_only_slot_named_args_are_templated():
+    # limit happens to equal the res_id in state, but is not a slot
+    assert template_args({"limit": 20}, "show places", {"res_id": 20}) == {"limit": 20}
+
+
+def test_unshareable_args_are_rejected():
+    assert template_args({"items": [{"id": "v_1"}]}, "add it", {}) is None
+    assert template_args({"res_id": 77}, "show menu", {}) is None
+    assert template_args({"phone_number": "9999999999"}, "log me in", {}) is None
+
+
+def test_context_dependent_inputs_are_not_cacheable():
+    for text in ("yes", "OK!", "2", " 1. ", "go ahead"):
+        assert not is_cacheable_input(text)
+    assert is_cacheable_input("what are my addresses")
+    assert is_cacheable_input("checkout")
+
+
+def test_key_includes_last_reply_only_for_references():
+    cache = PlanCache()
+    state = {"address_id": "addr1"}
+    history_a = [HumanMessage(content="hi"), AIMessage(content="Which address?")]
+    history_b = [HumanMessage(content="hi"), AIMessage(content="Proceed to checkout?")]
+    assert cache.make_key("gemini", "show it", state, history_a) != cache.make_key("gemini", "show it", state, history_b)
+    assert cache.make_key("gemini", "show it", state, history_a) == cache.make_key("gemini", "Show  it", state, history_a)
+    # Self-contained input: the previous reply doesn't matter
+    assert cache.make_key("gemini", "show pizza places", state, history_a) == cache.make_key("gemini", "show pizza places", state, history_b)
+
+
+class _FakePlanner:
+    """Stands in for the LLM: always plans the tool call in `plans[input]`."""
+
+    def __init__(self, plans):
+        self.plans = plans
+        self.calls = 0
+
+    def __call__(self, inputs):
+        self.calls += 1
+        tool, args = self.plans[inputs["input"]]
+        message = AIMessage(content="", tool_calls=[{"name": tool, "args": args, "id": f"id{self.calls}"}])
+        return [ToolAgentAction(tool=tool, tool_input=args, log="", message_log=[message], tool_call_id=f"id{self.calls}")]
+
+
+def _plan(planner, cache, user_input, state, chat_history=()):
+    agent = CachedPlanAgent(runnable=RunnableLambda(planner), plan_cache=cache, cache_context="test", state=state)
+    return asyncio.run(agent.aplan([], input=user_input, chat_history=list(chat_history)))
+
+
+def _enabled_cache():
+    cache = PlanCache(disabled_intents=["create_cart"])
+    cache.enabled = True
+    return cache
+
+
+def test_plan_is_replayed_for_another_user_with_their_state():
+    cache = _enabled_cache()
+    planner = _FakePlanner({"show pizza places": ("search_restaurants", {"keyword": "pizza", "address_id": "addrA"})})
+
+    first = _plan(planner, cache, "show pizza places", {"address_id": "addrA"})
+    second = _plan(planner, cache, "show pizza places", {"address_id": "addrB"})
+
+    assert planner.calls == 1
+    assert first[0].tool_input == {"keyword": "pizza", "address_id": "addrA"}
+    assert second[0].tool_input == {"keyword": "pizza", "address_id": "addrB"}
+
+
+def test_typed_restaurant_is_not_swapped_for_state_restaurant():
+    cache = _enabled_cache()
+    planner = _FakePlanner({"show menu of 123": ("get_menu", {"res_id": 123, "address_id": "addrA"})})
+
+    _plan(planner, cache, "show menu of 123", {"res_id": 123, "address_id": "addrA"})
+    replay = _plan(planner, cache, "show menu of 123", {"res_id": 999, "address_id": "addrB"})
+
+    assert planner.calls == 1
+    assert replay[0].tool_input == {"res_id": 123, "address_id": "addrB"}
+
+
+def test_yes_is_never_replayed_across_users():
+    cache = _enabled_cache()
+    planner = _FakePlanner({"yes": ("get_saved_addresses", {})})
+
+    _plan(planner, cache, "yes", {}, [AIMessage(content="Shall I list your addresses?")])
+    _plan(planner, cache, "yes", {}, [AIMessage(content="Proceed to checkout?")])
+
+    assert planner.calls == 2
+
+
+def test_same_input_after_different_reply_is_a_miss():
+    cache = _enabled_cache()
+    planner = _FakePlanner({"the first one": ("get_saved_addresses", {})})
+
+    _plan(planner, cache, "the first one", {}, [AIMessage(content="Pick an address")])
+    _plan(planner, cache, "the first one", {}, [AIMessage(content="Pick a restaurant")])
+    _plan(planner, cache, "the first one", {}, [AIMessage(content="Pick an address")])
+
+    assert planner.calls == 2
+
+
+def test_self_contained_input_hits_mid_conversation():
+    cache = _enabled_cache()
+    planner = _FakePlanner({"show pizza places": ("search_restaurants", {"keyword": "pizza", "address_id": "addrA"})})
+    state = {"address_id": "addrA"}
+
+    _plan(planner, cache, "show pizza places", state, [AIMessage(content="Here is the menu")])
+    _plan(planner, cache, "show pizza places", state, [AIMessage(content="Your order is on the way")])
+
+    assert planner.calls == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_disabled_intent_is_not_cached():
+    cache = _enabled_cache()
+    planner = _FakePlanner({"add pizza": ("create_cart", {"res_id": 5})})
+    state = {"res_id": 5}
+
+    _plan(planner, cache, "add pizza", state)
+    _plan(planner, cache, "add pizza", state)
+
+    assert planner.calls == 2
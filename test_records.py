@@ -0,0 +1,85 @@
+import json
+
+import records
+from records import (
+    Address, TrackingEntry, is_known_address, parse_addresses, parse_menu,
+    parse_restaurant_search, parse_tracking, remember_addresses,
+)
+
+
+def _restaurant(res_id, name):
+    info = {"name": name, "rating": {"aggregate_rating": 4.1}, "order": {"delivery_time": "30 min"}}
+    if res_id is not None:
+        info["res_id"] = res_id
+    return {"info": info}
+
+
+def test_search_dict_payload_dedups_and_drops_missing_ids():
+    payload = {
+        "restaurants": [_restaurant(1, "A"), _restaurant(None, "No id")],
+        "sections": {"SECTION_SEARCH_RESULT": [_restaurant(1, "A again"), _restaurant(2, "B")]},
+        "postback_params": "next",
+    }
+    restaurants, postback = parse_restaurant_search(json.dumps(payload))
+    assert [(r.res_id, r.name) for r in restaurants] == [(1, "A"), (2, "B")]
+    assert restaurants[0].rating == 4.1
+    assert postback == "next"
+
+
+def test_search_list_payload_keeps_every_item():
+    payload = [_restaurant(1, "A"), _restaurant(1, "A again"), _restaurant(None, "No id")]
+    restaurants, postback = parse_restaurant_search(payload)
+    assert [r.res_id for r in restaurants] == [1, 1, "N/A"]
+    assert postback is None
+
+
+def test_search_non_json_is_none():
+    assert parse_restaurant_search("Error: upstream timeout") is None
+
+
+def test_menu_walks_nested_categories():
+    payload = {"menus": [{"category": {"items": [
+        {"id": 10, "name": "Pizza", "variants": [{"variant_id": "v1", "name": "Large", "price": 300}]},
+        {"item_id": 11, "name": "Coke", "price": 60},
+    ]}}]}
+    items = parse_menu(payload)
+    assert [(i.item_id, i.name) for i in items] == [("10", "Pizza"), ("11", "Coke")]
+    assert items[0].variants[0].variant_id == "v1"
+    assert items[1].variants == ()
+
+
+def test_menu_tolerates_null_variant_name():
+    items = parse_menu([{"id": 1, "name": "Pizza", "variants": [{"id": 5, "name": None}]}])
+    assert items[0].variants[0].name == ""
+
+
+def test_tracking_falls_back_to_order_id():
+    payload = [
+        {"cart_id": "c1", "order_id": "o1", "order_status": "delivered"},
+        {"cart_id": "", "order_id": "o2", "status": "preparing"},
+        {"cart_id": 0},
+    ]
+    assert parse_tracking(payload) == (
+        TrackingEntry("c1", "delivered"),
+        TrackingEntry("o2", "preparing"),
+        TrackingEntry(None, "unknown"),
+    )
+
+
+def test_addresses_accept_both_keys():
+    payload = {"saved_addresses": [{"id": 7, "name": "Home", "address": "1 Main St"}, {"label": "no id"}]}
+    assert parse_addresses(payload) == (Address(7, "Home", "1 Main St"),)
+    assert parse_addresses({"addresses": []}) == ()
+
+
+def test_unknown_address_shape_is_none():
+    assert parse_addresses({"data": [{"id": 7}]}) is None
+    assert parse_addresses("not json") is None
+
+
+def test_is_known_address_is_none_until_fetched(monkeypatch):
+    monkeypatch.setattr(records, "_addresses", records.OrderedDict())
+    assert is_known_address(1, 7) is None
+    remember_addresses(1, (Address(7, "Home", ""),))
+    assert is_known_address(1, "7") is True
+    assert is_known_address(1, 8) is False
@@ -7,6 +7,7 @@ from langchain_core.tools import tool
 from config import ZOMATO_MCP_COMMAND, ZOMATO_MCP_ARGS
 from user_context import current_user_id
 import database
+import records
 
 # Global session for simplicity in this demo
 session = None
@@ -51,72 +52,25 @@ async def search_restaurants(keyword: str, address_id: str, limit: int = 20, min
         
     result = await session.call_tool("get_restaurants_for_keyword", args)
     
-    # Debug: Check returned data
-    # Parse and format the output
+    # Parse into compact records and format the output
     content = result.content[0].text
     try:
-        data = json.loads(content)
-        items = []
-        
-        # Extract postback_params for the next page
-        next_postback = data.get("postback_params")
-        # specific to Zomato structure, sometimes it's nested
-        
-        if isinstance(data, list):
-            items = data
-            print(f"DEBUG: Data is a list of {len(items)} items")
-        elif isinstance(data, dict):
-             # Try common structure
-             # Zomato sometimes puts promoted stats in 'restaurants' and organic in 'sections'
-             # We should grab BOTH.
-             
-             # 1. Check 'restaurants'
-             direct_items = data.get("restaurants", [])
-             if direct_items:
-                 print(f"DEBUG: Found {len(direct_items)} items in 'restaurants'")
-                 items.extend(direct_items)
-                 
-             # 2. Check 'sections' -> 'SECTION_SEARCH_RESULT'
-             sections = data.get("sections", {})
-             if sections:
-                 search_results = sections.get("SECTION_SEARCH_RESULT", [])
-                 if search_results:
-                     print(f"DEBUG: Found {len(search_results)} items in SECTION_SEARCH_RESULT")
-                     items.extend(search_results)
-             
-             # Deduplicate by res_id to be safe
-             seen_ids = set()
-             unique_items = []
-             for item in items:
-                 info = item.get("info", item)
-                 rid = info.get("res_id")
-                 if rid and rid not in seen_ids:
-                     seen_ids.add(rid)
-                     unique_items.append(item)
-             
-             items = unique_items
-        
-        # If we have a list of items, format them nicely to ensure LLM sees all of them
-        if items and isinstance(items, list):
-            print(f"DEBUG: Found {len(items)} items. Formatting...")
-            formatted_list = []
-            for item in items:
-                # Extract simplified info
-                info = item.get("info", item)
-                
-                name = info.get("name", "Unknown")
-                res_id = info.get("res_id", "N/A")
-                rating = info.get("rating", {}).get("aggregate_rating", "N/A")
-                if isinstance(info.get("rating"), str): rating = info.get("rating") 
-                
-                delivery_time = info.get("order", {}).get("delivery_time", "N/A")
-                formatted_list.append(f"- {name} (ID: {res_id}) | Rating: {rating} | Time: {delivery_time}")
-            
-            output_str = "\n".join(formatted_list)
-            if next_postback:
-                # Return the postback params as a JSON string so the LLM can use it
-                output_str += f"\n\n[Pagination] To see more results, call this tool again with postback_params='{json.dumps(next_postback)}'"
-            return output_str
+        parsed = records.parse_restaurant_search(content)
+        if parsed:
+            restaurants, next_postback = parsed
+            # If we have a list of items, format them nicely to ensure LLM sees all of them
+            if restaurants:
+                print(f"DEBUG: Found {len(restaurants)} items. Formatting...")
+                formatted_list = [
+                    f"- {r.name} (ID: {r.res_id}) | Rating: {r.rating} | Time: {r.delivery_time}"
+                    for r in restaurants
+                ]
+
+                output_str = "\n".join(formatted_list)
+                if next_postback:
+                    # Return the postback params as a JSON string so the LLM can use it
+                    output_str += f"\n\n[Pagination] To see more results, call this tool again with postback_params='{json.dumps(next_postback)}'"
+                return output_str
             
     except Exception as e:
         print(f"DEBUG: Error parsing/formatting: {e}")
@@ -128,7 +82,15 @@ async def get_menu(res_id: int, address_id: str):
     """Get the menu listing for a restaurant."""
     if not session: return "MCP Session not active"
     result = await session.call_tool("get_menu_items_listing", {"res_id": res_id, "address_id": address_id})
-    return result.content[0].text
+    content = result.content[0].text
+    # Keep a compact copy of the menu so create_cart can resolve variants
+    try:
+        menu_items = records.parse_menu(content)
+        if menu_items:
+            records.remember_menu(res_id, menu_items)
+    except Exception as e:
+        print(f"DEBUG: Failed to parse menu for {res_id}: {e}")
+    return content
 
 @tool
 async def create_cart(res_id: int, address_id: str, items: list, payment_type: str = "upi_qr"):
@@ -145,7 +107,12 @@ async def create_cart(res_id: int, address_id: str, items: list, payment_type: s
                          item["variant_id"] = item["id"]
                     # If it starts with ctl_, it is a dish id, not variant. 
                     # But if we don't have variant_id, the API fails.
-                    # We will try to rely on the LLM filtering, but let's at least not send malformed dicts.
+                    # If the dish has a single variant in the menu we fetched earlier, use it;
+                    # otherwise rely on the LLM filtering.
+                    else:
+                         menu_item = records.find_menu_item(res_id, item["id"])
+                         if menu_item and len(menu_item.variants) == 1:
+                              item["variant_id"] = menu_item.variants[0].variant_id
                     
         cart_args = {
             "res_id": res_id, 
@@ -292,22 +259,9 @@ async def get_tracking_info():
     content = result.content[0].text
     # Parse info to update DB if possible
     try:
-        import json
-        tracking_data = json.loads(content)
-        if isinstance(tracking_data, list):
-             for order in tracking_data:
-                 # Extract status from order structure
-                 # Structure varies, looking for common keys
-                 status = "unknown"
-                 # Example: order -> order_status or similar
-                 if "order_status" in order: status = order["order_status"]
-                 elif "status" in order: status = order["status"]
-                 
-                 # Also try to find cart_id/order_id to link
-                 cart_id = order.get("cart_id") or order.get("order_id") # Zomato uses order_id usually after checkout
-                 
-                 if cart_id and status != "unknown":
-                      database.update_order_status(str(cart_id), status)
+        for entry in records.parse_tracking(content) or ():
+             if entry.order_id and entry.status != "unknown":
+                  database.update_order_status(str(entry.order_id), entry.status)
                       
     except Exception as e:
         print(f"DEBUG: Failed to sync tracking status to DB: {e}")
@@ -319,8 +273,19 @@ async def get_saved_addresses():
     """Get user's saved addresses."""
     if not session: return "MCP Session not active"
     result = await session.call_tool("get_saved_addresses_for_user", {})
-    print(f"DEBUG: get_saved_addresses result: {result.content[0].text}")
-    return result.content[0].text
+    content = result.content[0].text
+    try:
+        addresses = records.parse_addresses(content)
+        if addresses is not None:
+            print(f"DEBUG: get_saved_addresses found {len(addresses)} addresses: {[a.address_id for a in addresses]}")
+            uid = current_user_id.get(None)
+            if uid:
+                records.remember_addresses(uid, addresses)
+        else:
+            print(f"DEBUG: get_saved_addresses result: {content}")
+    except Exception as e:
+        print(f"DEBUG: Failed to parse saved addresses: {e}")
+    return content
 
 class ZomatoClient:
     def __init__(self):